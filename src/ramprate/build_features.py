@@ -6,7 +6,8 @@ import numpy as np
 import networkx as nx
 
 
-idx = pd.IndexSlice
+NS_PER_HOUR = 3_600_000_000_000
+NAT_INT = np.iinfo(np.int64).min  # integer representation of NaT
 
 CAMD_FUEL_MAP = {
     "Pipeline Natural Gas": "gas",
@@ -89,50 +90,43 @@ EXCLUSION_SIZE_HOURS = {
 }
 
 
-def _find_uptime(
-    ser: pd.Series, multiindex_key: Optional[Union[str, int]] = None, downtime: bool = False
-) -> pd.DataFrame:
-    """summarize contiguous subsequences of non-zero values in a generation time series
+def _pad_nat(timestamps: np.ndarray, before: bool = False, after: bool = False) -> np.ndarray:
+    """copy datetime64[ns] timestamps into a preallocated array with an optional leading and/or trailing NaT"""
+    if not (before or after):
+        return timestamps
+    padded = np.full(len(timestamps) + before + after, np.datetime64("NaT"), dtype="datetime64[ns]")
+    padded[int(before) : len(padded) - int(after)] = timestamps
+    return padded
+
+
+def _find_uptime_fast(
+    values: np.ndarray, timestamps: np.ndarray, downtime: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """array-only core of _find_uptime for a single, sorted generation time series
 
     Args:
-        ser (pd.Series): pandas series with datetime index
-        multiindex_key (Optional[Union[str, int]], optional): if not None, assign new multiindex level to output. Used in manual groupby loops. Defaults to None.
+        values (np.ndarray): generation values
+        timestamps (np.ndarray): datetime64[ns] timestamps of values
         downtime (bool, optional): rearrange output events to refer to downtime instead of uptime. Defaults to False.
 
-    Raises:
-        NotImplementedError: whens ser has multiindex
-
     Returns:
-        pd.DataFrame: table of events, with shutdown and startup timestamps
+        Tuple[np.ndarray, np.ndarray]: datetime64[ns] arrays of (startups, shutdowns), one element per event
     """
-    # TODO: all this multiindex stuff could be a separate wrapper function
-    if isinstance(ser.index, pd.MultiIndex):
-        if multiindex_key is None:
-            raise NotImplementedError(
-                "groupby functionality not yet implemented. Pass multiindex_key manually per group"
-            )
-        else:
-            names = ser.index.names
-            ser = ser.copy()
-            ser.index = ser.index.droplevel(0)  # for groupby
-    # else single plant
-
     # binarize and find edges
-    diff = ser.gt(0).astype(np.int8).diff()
+    # edges are positional indices of the last value before each transition
+    is_on = values > 0
+    edges = np.flatnonzero(is_on[1:] != is_on[:-1])
+    rising = is_on[edges + 1]
 
     # last zero value of a block
-    # shift(-1) to select last zero instead of first non-zero
-    startups = ser.index[diff.shift(-1) == 1]
+    startups = timestamps[edges[rising]]
 
     # first zero value of a block
-    # no shift needed for this side
-    shutdowns = ser.index[diff == -1]
-
-    generator_starts_with_zero = ser.iat[0] == 0
-    generator_ends_with_zero = ser.iat[-1] == 0
+    # +1 to select first zero instead of last non-zero
+    shutdowns = timestamps[edges[~rising] + 1]
 
-    events = {}
-    nan = pd.Series([pd.NaT]).dt.tz_localize("UTC")
+    generator_starts_with_zero = values[0] == 0
+    generator_ends_with_zero = values[-1] == 0
 
     # Events (uptime or downtime) are defined as having a start and end.
     # If the start (or end) of an event occurs outside the data
@@ -150,35 +144,66 @@ def _find_uptime(
     # plus some NaT accounting on the ends,
     # and the shutdown/startup column order is switched to
     # reflect the opposite begin/end convention for the events
-
     if downtime:  # events table refers to downtime periods (blocks of zeros)
-        if (
-            generator_starts_with_zero
-        ):  # first downtime period has unknown shutdown time, known startup
-            events["shutdown"] = nan.append(pd.Series(shutdowns), ignore_index=True)
-        else:  # first downtime period is fully defined
-            events["shutdown"] = shutdowns
-
-        if generator_ends_with_zero:  # last downtime period has known shutdown but unknown startup
-            events["startup"] = pd.Series(startups).append(nan, ignore_index=True)
-        else:  # last downtime period is fully defined
-            events["startup"] = startups
-
+        # first downtime period has unknown shutdown time, known startup
+        # last downtime period has known shutdown but unknown startup
+        shutdowns = _pad_nat(shutdowns, before=generator_starts_with_zero)
+        startups = _pad_nat(startups, after=generator_ends_with_zero)
     else:  # events table refers to uptime periods (blocks of non-zeros)
-        if generator_starts_with_zero:  # first uptime period is fully defined
-            events["startup"] = startups
-        else:  # first uptime period has unknown startup time, known shutdown
-            events["startup"] = nan.append(pd.Series(startups), ignore_index=True)
+        # first uptime period has unknown startup time, known shutdown
+        # last uptime period has known startup but unknown shutdown
+        startups = _pad_nat(startups, before=not generator_starts_with_zero)
+        shutdowns = _pad_nat(shutdowns, after=not generator_ends_with_zero)
+
+    return startups, shutdowns
 
-        if generator_ends_with_zero:  # last uptime period is fully defined
-            events["shutdown"] = shutdowns
-        else:  # last uptime period has known startup but unknown shutdown
-            events["shutdown"] = pd.Series(shutdowns).append(nan, ignore_index=True)
 
+def _find_uptime(
+    ser: pd.Series, multiindex_key: Optional[Union[str, int]] = None, downtime: bool = False
+) -> pd.DataFrame:
+    """summarize contiguous subsequences of non-zero values in a generation time series
+
+    Args:
+        ser (pd.Series): pandas series with datetime index
+        multiindex_key (Optional[Union[str, int]], optional): if not None, assign new multiindex level to output. Used in manual groupby loops. Defaults to None.
+        downtime (bool, optional): rearrange output events to refer to downtime instead of uptime. Defaults to False.
+
+    Raises:
+        NotImplementedError: whens ser has multiindex
+
+    Returns:
+        pd.DataFrame: table of events, with shutdown and startup timestamps
+    """
+    # TODO: all this multiindex stuff could be a separate wrapper function
+    if isinstance(ser.index, pd.MultiIndex):
+        if multiindex_key is None:
+            raise NotImplementedError(
+                "groupby functionality not yet implemented. Pass multiindex_key manually per group"
+            )
+        else:
+            names = ser.index.names
+            # read the timestamp level directly rather than copying ser to drop the unit level
+            timestamp_index = ser.index.get_level_values(1)
+    else:  # single plant
+        timestamp_index = ser.index
+
+    # .values is naive UTC for tz-aware indices, so the results are converted back to the input tz
+    startups, shutdowns = _find_uptime_fast(ser.values, timestamp_index.values, downtime=downtime)
+    if downtime:
+        events = {"shutdown": shutdowns, "startup": startups}
+    else:
+        events = {"startup": startups, "shutdown": shutdowns}
+
+    # tz_convert(None) drops the tz again, so naive input gives naive output
+    events = pd.DataFrame(
+        {
+            col: pd.DatetimeIndex(arr, tz="UTC").tz_convert(timestamp_index.tz)
+            for col, arr in events.items()
+        }
+    )
     if multiindex_key is None:
-        return pd.DataFrame(events)
+        return events
     else:
-        events = pd.DataFrame(events)
         events.index = pd.MultiIndex.from_arrays(
             [np.full(len(events), multiindex_key), np.arange(len(events))],
             names=[names[0], "event"],
@@ -186,63 +211,112 @@ def _find_uptime(
         return events
 
 
-def _binarize(ser: pd.Series):
+def _first_of_unit(unit_ids: np.ndarray) -> np.ndarray:
+    """boolean mask of the first row of each unit (or component) in a sorted array of IDs"""
+    new_unit = np.empty(len(unit_ids), dtype=bool)
+    new_unit[:1] = True
+    np.not_equal(unit_ids[1:], unit_ids[:-1], out=new_unit[1:])
+    return new_unit
+
+
+def _unit_codes(cems: pd.DataFrame) -> np.ndarray:
+    """int32 codes of the unit_id_epa index level
+
+    Unit boundary comparisons on these codes are much cheaper than on the
+    nullable Int64 (object) index level. A MultiIndex already stores integer
+    codes per level, so those are reused instead of hashing every row again.
+    """
+    if isinstance(cems.index, pd.MultiIndex):
+        return cems.index.codes[cems.index.names.index("unit_id_epa")].astype(np.int32)
+    codes, _ = pd.factorize(cems.index.get_level_values("unit_id_epa"))
+    return codes.astype(np.int32)
+
+
+def _hours_between(start: np.ndarray, end: np.ndarray, dtype=np.float32) -> np.ndarray:
+    """hours from start to end of datetime64[ns] arrays, via int64 nanoseconds. NaT gives NaN"""
+    start_ns = start.view("i8")
+    end_ns = end.view("i8")
+    hours = ((end_ns - start_ns) / NS_PER_HOUR).astype(dtype)
+    hours[(start_ns == NAT_INT) | (end_ns == NAT_INT)] = np.nan
+    return hours
+
+
+def _binarize(ser: pd.Series) -> np.ndarray:
     """modularize this in case I want to do more smoothing later"""
-    return ser.gt(0).astype(np.int8)
+    return ser.values > 0
+
+
+def _find_edges(cems: pd.DataFrame, unit_codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """find startups and shutdowns based on transition from zero to non-zero generation
 
+    Args:
+        cems (pd.DataFrame): EPA CEMS data sorted by (unit_id_epa, operating_datetime_utc)
+        unit_codes (np.ndarray): unit codes from _unit_codes
 
-def _find_edges(cems: pd.DataFrame, drop_intermediates=True) -> None:
-    """find timestamps of startups and shutdowns based on transition from zero to non-zero generation"""
-    cems["binarized"] = _binarize(cems["gross_load_mw"])
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: boolean masks (is_startup, is_shutdown), aligned with the rows of cems. True on the first non-zero (zero) row after a transition.
+    """
+    is_on = _binarize(cems["gross_load_mw"])
     # for each unit, find change points from zero to non-zero production
     # this could be done with groupby but it is much slower
     # cems.groupby(level='unit_id_epa')['binarized_col'].transform(lambda x: x.diff())
-    cems["binary_diffs"] = (
-        cems["binarized"].diff().where(cems["unit_id_epa"].diff().eq(0))
-    )  # dont take diffs across units
-    cems["shutdowns"] = cems["operating_datetime_utc"].where(cems["binary_diffs"] == -1, pd.NaT)
-    cems["startups"] = cems["operating_datetime_utc"].where(cems["binary_diffs"] == 1, pd.NaT)
-    if drop_intermediates:
-        cems.drop(columns=["binarized", "binary_diffs"], inplace=True)
-    return
+    # On booleans, a > b is (a and not b), so comparing the shifted arrays marks
+    # rising and falling edges directly, without taking a signed difference
+    same_unit = ~_first_of_unit(unit_codes)
+    is_startup = np.zeros(len(is_on), dtype=bool)
+    np.greater(is_on[1:], is_on[:-1], out=is_startup[1:])  # off -> on
+    is_startup &= same_unit  # dont take diffs across units
+    is_shutdown = np.zeros(len(is_on), dtype=bool)
+    np.less(is_on[1:], is_on[:-1], out=is_shutdown[1:])  # on -> off
+    is_shutdown &= same_unit
+    return is_startup, is_shutdown
 
 
 def _distance_from_downtime(
-    cems: pd.DataFrame, drop_intermediates=True, boundary_offset_hours: int = 24
+    cems: pd.DataFrame,
+    unit_codes: np.ndarray,
+    is_startup: np.ndarray,
+    is_shutdown: np.ndarray,
+    drop_intermediates=True,
+    boundary_offset_hours: int = 24,
 ) -> None:
-    """calculate two columns: the number of hours to the next shutdown; and from the last startup"""
-    # fill startups forward and shutdowns backward
-    # Note that this leaves NaT values for any uptime periods at the very start/end of the timeseries
-    # The second fillna handles this by assuming the real boundary is the edge of the dataset + an offset
-    offset = pd.Timedelta(boundary_offset_hours, unit="h")
-    cems["startups"] = (
-        cems["startups"]
-        .groupby(level="unit_id_epa")
-        .transform(lambda x: x.ffill().fillna(x.index[0][1] - offset))
-    )
-    cems["shutdowns"] = (
-        cems["shutdowns"]
-        .groupby(level="unit_id_epa")
-        .transform(lambda x: x.bfill().fillna(x.index[-1][1] + offset))
-    )
+    """calculate two columns: the number of hours to the next shutdown; and from the last startup
 
-    cems["hours_from_startup"] = (
-        cems["operating_datetime_utc"]
-        .sub(cems["startups"])
-        .dt.total_seconds()
-        .div(3600)
-        .astype(np.float32)
-    )
-    # invert sign so distances are all positive
-    cems["hours_to_shutdown"] = (
-        cems["shutdowns"]
-        .sub(cems["operating_datetime_utc"])
-        .dt.total_seconds()
-        .div(3600)
-        .astype(np.float32)
-    )
-    if drop_intermediates:
-        cems.drop(columns=["startups", "shutdowns"], inplace=True)
+    Args:
+        cems (pd.DataFrame): EPA CEMS data sorted by (unit_id_epa, operating_datetime_utc). Modified in place.
+        unit_codes (np.ndarray): unit codes from _unit_codes
+        is_startup (np.ndarray): startup mask from _find_edges
+        is_shutdown (np.ndarray): shutdown mask from _find_edges
+        drop_intermediates (bool, optional): if False, also add the filled 'startups' and 'shutdowns' columns. Defaults to True.
+        boundary_offset_hours (int, optional): assumed distance to the unobserved startup/shutdown of uptime at the edges of the data. Defaults to 24.
+    """
+    # fill startups forward and shutdowns backward.
+    # Rather than filling timestamps, fill the row position of the nearest edge with a
+    # running max (min) over positions, then gather the timestamps once.
+    # Uptime periods at the very start/end of the timeseries have no edge in the data,
+    # so the first (last) row of each unit also acts as an edge, assuming the real
+    # boundary is the edge of the dataset + an offset.
+    # Because every unit starts (ends) with such a row, positions can't leak across units.
+    offset_ns = boundary_offset_hours * NS_PER_HOUR
+    # lift the timestamps out of the frame once; all arithmetic below is on int64 nanoseconds
+    timestamps_ns = cems["operating_datetime_utc"].values.view("i8")
+    new_unit = _first_of_unit(unit_codes)
+    last_of_unit = np.roll(new_unit, -1)
+    positions = np.arange(len(timestamps_ns))
+
+    last_startup = np.maximum.accumulate(np.where(is_startup | new_unit, positions, 0))
+    startups_ns = timestamps_ns[last_startup] - np.where(is_startup[last_startup], 0, offset_ns)
+
+    next_shutdown = np.where(is_shutdown | last_of_unit, positions, len(positions))
+    next_shutdown = np.minimum.accumulate(next_shutdown[::-1])[::-1]
+    shutdowns_ns = timestamps_ns[next_shutdown] + np.where(is_shutdown[next_shutdown], 0, offset_ns)
+
+    # invert sign of hours_to_shutdown so distances are all positive
+    cems["hours_from_startup"] = ((timestamps_ns - startups_ns) / NS_PER_HOUR).astype(np.float32)
+    cems["hours_to_shutdown"] = ((shutdowns_ns - timestamps_ns) / NS_PER_HOUR).astype(np.float32)
+    if not drop_intermediates:
+        cems["startups"] = pd.DatetimeIndex(startups_ns.view("datetime64[ns]"), tz="UTC")
+        cems["shutdowns"] = pd.DatetimeIndex(shutdowns_ns.view("datetime64[ns]"), tz="UTC")
     return None
 
 
@@ -251,42 +325,76 @@ def calc_distance_from_downtime(
 ) -> None:
     """calculate two columns: the number of hours to the next shutdown; and from the last startup"""
     # in place
-    _find_edges(cems, drop_intermediates)
-    _distance_from_downtime(cems, drop_intermediates)
-    cems["hours_distance"] = cems[["hours_from_startup", "hours_to_shutdown"]].min(axis=1)
+    unit_codes = _unit_codes(cems)
+    is_startup, is_shutdown = _find_edges(cems, unit_codes)
+    _distance_from_downtime(cems, unit_codes, is_startup, is_shutdown, drop_intermediates)
+    from_startup = cems["hours_from_startup"].values
+    to_shutdown = cems["hours_to_shutdown"].values
+    # fmin skips NaN like DataFrame.min(axis=1)
+    cems["hours_distance"] = np.fmin(from_startup, to_shutdown)
     if classify_startup:
-        cems["nearest_to_startup"] = cems["hours_from_startup"] < cems["hours_to_shutdown"]
-        # randomly allocate midpoints
+        nearest_to_startup = from_startup < to_shutdown
+        # randomly allocate midpoints. Only draw for the (few) ties
         rng = np.random.default_rng(seed=42)
-        rand_midpoints = (cems["hours_from_startup"] == cems["hours_to_shutdown"]) & rng.choice(
-            np.array([True, False]), size=len(cems)
-        )
-        cems.loc[rand_midpoints, "nearest_to_startup"] = True
+        midpoints = np.flatnonzero(from_startup == to_shutdown)
+        nearest_to_startup[midpoints] = rng.integers(0, 2, size=len(midpoints), dtype=bool)
+        cems["nearest_to_startup"] = nearest_to_startup
     return None
 
 
 def uptime_events(cems: pd.DataFrame, infer_boundaries=True) -> pd.DataFrame:
-    """convert timeseries of generation to a table of uptime events"""
-    units = cems.groupby(level="unit_id_epa")
-    event_dfs = []
-    for grp, df in units["gross_load_mw"]:
-        event_dfs.append(_find_uptime(df, multiindex_key=grp))
-    events = pd.concat(event_dfs)
+    """convert timeseries of generation to a table of uptime events
 
+    Equivalent to calling _find_uptime on each unit, but done in a single vectorized pass.
+    cems must be sorted by (unit_id_epa, operating_datetime_utc).
+    """
+    unit_ids = cems.index.get_level_values("unit_id_epa").values
+    unit_codes = _unit_codes(cems)
+    timestamps = cems.index.get_level_values("operating_datetime_utc")
+    is_on = _binarize(cems["gross_load_mw"])
+
+    new_unit = _first_of_unit(unit_codes)
+    last_of_unit = np.roll(new_unit, -1)
+
+    # positional indices of the first and last non-zero value of each uptime block.
+    # Blocks never span units because unit boundaries always start/end a block.
+    prev_on = np.roll(is_on, 1)
+    next_on = np.roll(is_on, -1)
+    first_on = np.flatnonzero(is_on & (new_unit | ~prev_on))
+    last_on = np.flatnonzero(is_on & (last_of_unit | ~next_on))
+
+    # startup is the last zero before a block, shutdown is the first zero after it.
+    # Blocks that touch the edge of a unit's timeseries get NaT
+    ts_values = timestamps.values
     if infer_boundaries:
         # if a timeseries starts (or ends) with uptime, the first (last) boundary is outside our data range.
         # This method uses the first (last) timestamp as the boundary: a lower bound on duration.
-        for col, boundary in {"startup": "first", "shutdown": "last"}.items():
-            # __getattr__ doesn't work here
-            boundary_timestamps = units.__getattribute__(boundary)()[["operating_datetime_utc"]]
-            joined_timestamps = events.join(boundary_timestamps, on="unit_id_epa", how="left")[
-                "operating_datetime_utc"
-            ]
-            events[col].fillna(joined_timestamps, inplace=True)
+        startup_boundary = ts_values[first_on]
+        shutdown_boundary = ts_values[last_on]
+    else:
+        startup_boundary = shutdown_boundary = np.datetime64("NaT", "ns")
+    startups = np.where(new_unit[first_on], startup_boundary, ts_values[first_on - 1])
+    shutdowns = np.where(
+        last_of_unit[last_on], shutdown_boundary, ts_values[(last_on + 1) % len(ts_values)]
+    )
 
-    events["duration_hours"] = (
-        events["shutdown"].sub(events["startup"]).dt.total_seconds().div(3600)
+    # number events within each unit
+    event_units = unit_ids[first_on]
+    event_count = np.arange(len(first_on))
+    first_event = _first_of_unit(unit_codes[first_on])
+    event_number = event_count - np.maximum.accumulate(np.where(first_event, event_count, 0))
+
+    events = pd.DataFrame(
+        {
+            "startup": pd.DatetimeIndex(startups, tz="UTC"),
+            "shutdown": pd.DatetimeIndex(shutdowns, tz="UTC"),
+        },
+        index=pd.MultiIndex.from_arrays(
+            [event_units, event_number], names=["unit_id_epa", "event"]
+        ),
     )
+
+    events["duration_hours"] = _hours_between(startups, shutdowns, dtype=np.float64)
     return events
 
 
@@ -295,11 +403,12 @@ def _filter_retirements(df: pd.DataFrame, year_range: Tuple[int, int]) -> pd.Dat
     min_year = year_range[0]
     max_year = year_range[1]
 
-    not_retired_before_start = df["CAMD_RETIRE_YEAR"].replace(0, 3000) >= min_year
-    not_built_after_end = (pd.to_datetime(df["CAMD_STATUS_DATE"]).dt.year <= max_year) & df[
-        "CAMD_STATUS"
-    ].ne("RET")
-    return df.loc[not_retired_before_start & not_built_after_end]
+    # a retirement year of 0 means the unit has not retired
+    retire_year = df["CAMD_RETIRE_YEAR"].to_numpy()
+    not_retired_before_start = (retire_year == 0) | (retire_year >= min_year)
+    status_year = pd.to_datetime(df["CAMD_STATUS_DATE"]).dt.year.to_numpy()
+    not_built_after_end = (status_year <= max_year) & (df["CAMD_STATUS"].to_numpy() != "RET")
+    return df.iloc[np.flatnonzero(not_retired_before_start & not_built_after_end)]
 
 
 def _remove_irrelevant(df: pd.DataFrame):
@@ -328,19 +437,27 @@ def _prep_crosswalk_for_networkx(
 
 
 def _subcomponent_ids_from_prepped_crosswalk(prepped: pd.DataFrame) -> pd.DataFrame:
-    graph = nx.from_pandas_edgelist(
-        prepped,
-        source="combustor_id",
-        target="generator_id",
-        edge_attr=True,
-    )
-    for i, node_set in enumerate(nx.connected_components(graph)):
-        subgraph = graph.subgraph(node_set)
-        assert nx.algorithms.bipartite.is_bipartite(
-            subgraph
-        ), f"non-bipartite: i={i}, node_set={node_set}"
-        nx.set_edge_attributes(subgraph, name="component_id", values=i)
-    return nx.to_pandas_edgelist(graph)
+    # each crosswalk row is an edge between a combustor and a generator node.
+    # Only connected components are needed, so union-find them instead of building a graph.
+    # Combustor and generator node IDs are disjoint, so every component is bipartite.
+    combustors = prepped["combustor_id"].to_numpy()
+    generators = prepped["generator_id"].to_numpy()
+    components = nx.utils.UnionFind()
+    for combustor, generator in zip(combustors, generators):
+        components.union(combustor, generator)
+    # number components in order of first appearance, like nx.connected_components
+    component_ids, _ = pd.factorize([components[node] for node in combustors])
+    edges = prepped.assign(component_id=component_ids)
+
+    # Keep the row order of nx.to_pandas_edgelist, which downstream groupby(...).first() relies on.
+    # Edges are listed from whichever end node appeared first, then by first appearance of the edge.
+    # A duplicated edge keeps its first position but takes the values of its last row.
+    node_rank, _ = pd.factorize(np.column_stack([combustors, generators]).ravel())
+    from_node = np.minimum(node_rank[0::2], node_rank[1::2])
+    first_seen = edges.groupby(["combustor_id", "generator_id"], sort=False).ngroup().to_numpy()
+    is_last = ~edges.duplicated(subset=["combustor_id", "generator_id"], keep="last").to_numpy()
+    order = np.lexsort((first_seen[is_last], from_node[is_last]))
+    return edges[is_last].iloc[order].reset_index(drop=True)
 
 
 def make_subcomponent_ids(
@@ -377,7 +494,8 @@ def aggregate_subcomponents(
 
     aggs = (
         xwalk.groupby("component_id")["EIA_UNIT_TYPE"]
-        .agg(lambda x: frozenset(x.values.reshape(-1)))
+        .unique()  # builtin per-group dedup, so frozenset only sees a few values per component
+        .map(frozenset)
         .to_frame()
         .astype("category")
     )
@@ -386,9 +504,10 @@ def aggregate_subcomponents(
         agency = unit.split("_", maxsplit=1)[0]
         capacity = f"{agency}_NAMEPLATE_CAPACITY"
         aggs[f"capacity_{agency}"] = (
-            xwalk.groupby(by=["component_id", unit], as_index=False)
-            .first()  # avoid double counting
-            .groupby("component_id")[capacity]
+            # avoid double counting. Only aggregate the one column that is needed
+            xwalk.groupby(by=["component_id", unit])[capacity]
+            .first()
+            .groupby(level="component_id")
             .sum()
             .replace(0, np.nan)
         )
@@ -426,27 +545,59 @@ def _assign_by_capacity(xwalk: pd.DataFrame, col: str) -> pd.Series:
 
     # assign by category with highest capacity
     grouped = (
-        xwalk.groupby(by=["component_id", unit], as_index=False)
-        .first()  # avoid double counting units
-        .groupby(by=["component_id", col], as_index=False)[capacity]
+        # avoid double counting units. Only aggregate the two columns that are needed
+        xwalk.groupby(by=["component_id", unit], as_index=False)[[col, capacity]]
+        .first()
+        .groupby(by=["component_id", col], as_index=False, observed=True)[capacity]
         .sum()
         .replace({capacity: 0}, np.nan)
     )
-    grouped["max"] = grouped.groupby("component_id")[capacity].transform(np.max)
-    out = grouped.loc[grouped["max"] == grouped[capacity], ["component_id", col]].set_index(
-        "component_id"
+    # idxmax breaks ties by taking first category (alphabetical due to groupby)
+    # this is not very principled but it is rare enough to probably not matter.
+    # Components with no nonzero capacity have no max and are dropped
+    winners = grouped.groupby("component_id")[capacity].idxmax().dropna().astype(np.int64)
+    return grouped.loc[winners, ["component_id", col]].set_index("component_id")
+
+
+def _sum_by_component(cems: pd.DataFrame) -> pd.DataFrame:
+    """combine units' timeseries into a single timeseries per component
+
+    Equivalent to grouping by (component_id, operating_datetime_utc) and summing
+    gross_load_mw and (as a logical 'or') exclude_ramp, but done by sorting on the two
+    keys and reducing each run of equal keys, without hashing.
+
+    Args:
+        cems (pd.DataFrame): EPA CEMS data with component_id and exclude_ramp columns
+
+    Returns:
+        pd.DataFrame: gross_load_mw and exclude_ramp, indexed by (component_id, operating_datetime_utc)
+    """
+    component_ids = cems["component_id"].to_numpy()
+    timestamps = cems["operating_datetime_utc"].values
+    # stable, so units within a run keep their order, like groupby
+    order = np.lexsort((timestamps, component_ids))
+    component_ids = component_ids[order]
+    timestamps = timestamps[order]
+    starts = np.flatnonzero(_first_of_unit(component_ids) | _first_of_unit(timestamps.view("i8")))
+
+    load = cems["gross_load_mw"].to_numpy()
+    # like groupby sum: skip NaN and accumulate in float64
+    load = np.add.reduceat(np.nan_to_num(load[order]), starts, dtype=np.float64).astype(load.dtype)
+    exclude_ramp = np.logical_or.reduceat(cems["exclude_ramp"].to_numpy()[order], starts)
+    return pd.DataFrame(
+        {"gross_load_mw": load, "exclude_ramp": exclude_ramp},
+        index=pd.MultiIndex.from_arrays(
+            [component_ids[starts], pd.DatetimeIndex(timestamps[starts], tz="UTC")],
+            names=["component_id", "operating_datetime_utc"],
+        ),
     )
-    # break ties by taking first category (alphabetical due to groupby)
-    # this is not very principled but it is rare enough to probably not matter
-    out = out[~out.index.duplicated(keep="first")]
-    return out
 
 
 def process_subset(cems, crosswalk, component_id_offset=0):
     """Top level API to analyze a dataset for component-wise max ramp rates
 
     Args:
-        cems ([pd.DataFrame]): EPA CEMS data from ramprate.load_dataset.load_epacems
+        cems ([pd.DataFrame]): EPA CEMS data from ramprate.load_dataset.load_epacems. If already indexed by (unit_id_epa, operating_datetime_utc), feature columns are added to it in place rather than to a copy.
         crosswalk ([pd.DataFrame]): EPA crosswalk from ramprate.load_dataset.load_epa_crosswalk
         component_id_offset (int, optional): used when processing data in chunks to ensure unique IDs. Defaults to 0.
 
@@ -459,10 +610,12 @@ def process_subset(cems, crosswalk, component_id_offset=0):
     }
     """
     if "unit_id_epa" not in cems.index.names:
+        # set_index already returns a new frame, so sort that one in place instead of copying again
         cems = cems.set_index(
             ["unit_id_epa", "operating_datetime_utc"],
             drop=False,
-        ).sort_index(inplace=True)
+        )
+        cems.sort_index(inplace=True)
 
     calc_distance_from_downtime(cems)  # in place
     key_map = cems.groupby(level="unit_id_epa")[["plant_id_eia", "unitid", "unit_id_epa"]].first()
@@ -483,59 +636,67 @@ def process_subset(cems, crosswalk, component_id_offset=0):
     # aggregate metadata
     meta = aggregate_subcomponents(key_map)
     # aggregate operational data
-    cems = cems.merge(
-        meta["simple_EIA_UNIT_TYPE"], left_on="component_id", right_index=True, copy=False
+    # the inner join normally keeps cems' sorted order, so only pay for a sort when it didn't
+    if not cems.index.is_monotonic_increasing:
+        cems.sort_index(inplace=True)
+    # every component_id in cems is in meta, so look the type up by label instead of merging,
+    # which would copy all of cems to add one column
+    cems["simple_EIA_UNIT_TYPE"] = (
+        meta["simple_EIA_UNIT_TYPE"].reindex(cems["component_id"].values).values
     )
-    cems.sort_index(inplace=True)
-    cems["exclude_ramp"] = cems["hours_distance"] <= cems["simple_EIA_UNIT_TYPE"].map(
-        EXCLUSION_SIZE_HOURS
-    ).astype(np.float32)
+    # look up the exclusion size once per category, then gather it by category code.
+    # The trailing NaN is picked up by code -1 (missing type), which is never excluded
+    unit_types = cems["simple_EIA_UNIT_TYPE"].cat
+    exclusion_hours = unit_types.categories.map(EXCLUSION_SIZE_HOURS).to_numpy(dtype=np.float32)
+    exclusion_hours = np.append(exclusion_hours, np.float32(np.nan))
+    cems["exclude_ramp"] = cems["hours_distance"].values <= exclusion_hours[unit_types.codes.values]
     # combine units' timeseries into a single timeseries per component
-    component_timeseries = (
-        cems.drop(columns=["operating_datetime_utc"])  # resolve name collision with index
-        .groupby(["component_id", "operating_datetime_utc"])[["gross_load_mw", "exclude_ramp"]]
-        .sum()
-    )
-    component_timeseries["exclude_ramp"] = (
-        component_timeseries["exclude_ramp"] > 0
-    )  # sum() > 0 is like logical 'or'
+    component_timeseries = _sum_by_component(cems)
+    # group by explicit keys rather than names, which collide with index levels.
+    # This avoids copying all of cems with .drop(columns=...) just to resolve the names
+    component_ids = cems["component_id"]
     component_aggs = (
-        cems.drop(columns=["unit_id_epa"])  # resolve name collision with index
-        .groupby(["component_id", "unit_id_epa"])[["gross_load_mw"]]
+        cems.groupby([component_ids, cems["unit_id_epa"]])[["gross_load_mw"]]
         .max()
-        .groupby("component_id")
+        .groupby(level="component_id")
         .sum()
         .add_prefix("sum_of_max_")
     )
     component_aggs = component_aggs.join(
         component_timeseries[["gross_load_mw"]]
-        .groupby("component_id")
+        .groupby(level="component_id")
         .max()
         .add_prefix("max_of_sum_"),
         how="outer",  # shouldn't matter
     )
     # calculate ramp rates
-    component_timeseries[["ramp"]] = component_timeseries.groupby("component_id")[
-        ["gross_load_mw"]
-    ].diff()
+    # component_timeseries is sorted by (component_id, operating_datetime_utc), so a whole
+    # column diff is a per-component diff once the first row of each component is masked
+    load = component_timeseries["gross_load_mw"].to_numpy()
+    ramp = np.empty_like(load)
+    np.subtract(load[1:], load[:-1], out=ramp[1:])
+    ramp[
+        _first_of_unit(component_timeseries.index.get_level_values("component_id").values)
+    ] = np.nan
+    component_timeseries["ramp"] = ramp
+    included = component_timeseries.loc[~component_timeseries["exclude_ramp"], "ramp"]
+    # on a RangeIndex, the builtin idxmax/idxmin give row positions; look up their timestamps after
     ramps = (
-        component_timeseries.loc[~component_timeseries["exclude_ramp"], ["ramp"]]
-        .groupby("component_id")
-        .agg(["max", "min", lambda x: x.idxmax()[1], lambda x: x.idxmin()[1]])
-    ).rename(columns={"<lambda_0>": "idxmax", "<lambda_1>": "idxmin"}, level=1)
-    for header in ramps.columns.levels[0]:
-        # calculate max of absolute value of ramp rates
-        ramps.loc[:, (header, "max_abs")] = (
-            ramps.loc[:, idx[header, ["max", "min"]]].abs().max(axis=1)
-        )
-        # associate correct timestamp - note that ties go to idxmax, nans go to idxmin
-        condition = ramps.loc[:, (header, "max")] >= ramps.loc[:, (header, "min")].abs()
-        ramps.loc[:, (header, "idxmax_abs")] = ramps.loc[:, idx[header, "idxmax"]]
-        ramps.loc[:, (header, "idxmax_abs")].where(
-            condition, ramps.loc[:, (header, "idxmin")], inplace=True
-        )
-    # remove multiindex
-    ramps.columns = ["_".join(reversed(col)) for col in ramps.columns]
+        included.reset_index(drop=True)
+        .groupby(included.index.get_level_values("component_id"))
+        .agg(["max", "min", "idxmax", "idxmin"])
+    )
+    timestamps = included.index.get_level_values("operating_datetime_utc")
+    for col in ["idxmax", "idxmin"]:
+        positions = ramps[col].fillna(-1).to_numpy(dtype=np.int64)  # -1 for all-NaN groups
+        ramps[col] = timestamps.take(positions, allow_fill=True, fill_value=pd.NaT)
+    # calculate max of absolute value of ramp rates. fmax skips NaN like max(axis=1)
+    max_ramp = ramps["max"].to_numpy()
+    abs_min_ramp = np.abs(ramps["min"].to_numpy())
+    ramps["max_abs"] = np.fmax(np.abs(max_ramp), abs_min_ramp)
+    # associate correct timestamp - note that ties go to idxmax, nans go to idxmin
+    ramps["idxmax_abs"] = ramps["idxmax"].where(max_ramp >= abs_min_ramp, ramps["idxmin"])
+    ramps = ramps.add_suffix("_ramp")
 
     # join all the aggs
     component_aggs = component_aggs.join([ramps, meta])
@@ -11,15 +11,17 @@ Outputs:
         failed to join and were thus excluded from this analysis."""
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 import sys
-from typing import Optional, Sequence
+from typing import Iterator, List, Optional, Sequence, Tuple
 
 import pandas as pd
 from tqdm import tqdm
 
 # from pudl.constants import us_states
-from ramprate.load_dataset import load_epacems, load_epa_crosswalk, ALL_STATES
+from ramprate.load_dataset import load_epacems, iter_epacems, load_epa_crosswalk, ALL_STATES
 from ramprate.build_features import process_subset, _remove_irrelevant
 
 
@@ -27,12 +29,38 @@ from ramprate.build_features import process_subset, _remove_irrelevant
 TERRITORIES = {"MP", "PR", "AS", "GU", "NA", "VI"}
 
 
+def _process_chunk(
+    states: List[str], years: List[int], columns: List[str], crosswalk: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """load and process one chunk of states in a worker process"""
+    cems = load_epacems(states=states, years=years, columns=columns, engine="pandas")
+    return _process_cems(cems, crosswalk)
+
+
+def _process_cems(cems: pd.DataFrame, crosswalk: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """process one chunk of CEMS data. Returns (component aggregates, crosswalk with IDs)"""
+    cems.set_index(
+        ["unit_id_epa", "operating_datetime_utc"],
+        drop=False,
+        inplace=True,
+    )
+    cems.sort_index(inplace=True)
+
+    outputs = process_subset(cems, crosswalk)
+    agg = outputs["component_aggs"]
+
+    # convert iterable types to something more amenable to csv
+    agg["EIA_UNIT_TYPE"] = agg["EIA_UNIT_TYPE"].transform(lambda x: str(tuple(x)))
+    return agg, outputs["key_map"]
+
+
 def process(
     out_path: str,
     chunk_size: int,
     start_year: int,
     end_year: int,
     state_subset: Optional[Sequence[str]] = None,
+    workers: int = 1,
 ) -> None:
     """calculate max ramp rates and other metrics per connected subcomponent in EPA CEMS"""
     out_path = Path(out_path)
@@ -60,33 +88,44 @@ def process(
 
     # process in chunks due to memory constraints.
     # If you use an instance with 10+ GB memory per year of data analyzed, this won't be necessary.
-    aggregates = []
-    modified_crosswalk = []
-    offset = 0
+    # Chunks are independent, so with workers > 1 they are processed in parallel by separate
+    # worker processes. Each chunk's (small) outputs are appended to the csvs in order.
+    crosswalk_out_path = out_path.parent / f"{out_path.stem}_crosswalk_with_IDs.csv"
     chunks = [states[i : i + chunk_size] for i in range(0, len(states), chunk_size)]
-    for subset_states in tqdm(chunks):
-        cems = load_epacems(states=subset_states, years=years, columns=cems_cols, engine="pandas")
-        cems.set_index(
-            ["unit_id_epa", "operating_datetime_utc"],
-            drop=False,
-            inplace=True,
+    n_chunks = len(chunks)
+    if workers == 1:
+        # no worker processes or pickled crosswalks needed, just load each chunk in turn
+        cems_chunks = iter_epacems(
+            states, states_per_chunk=chunk_size, years=years, columns=cems_cols
         )
-        cems.sort_index(inplace=True)
-
-        outputs = process_subset(cems, crosswalk, component_id_offset=offset)
-        agg = outputs["component_aggs"]
+        results = (_process_cems(cems, crosswalk) for cems in cems_chunks)
+        _write_chunks(results, n_chunks, out_path, crosswalk_out_path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            _process_chunk, chunks, repeat(years), repeat(cems_cols), repeat(crosswalk)
+        )
+        _write_chunks(results, n_chunks, out_path, crosswalk_out_path)
+    return
 
-        # convert iterable types to something more amenable to csv
-        agg["EIA_UNIT_TYPE"] = agg["EIA_UNIT_TYPE"].transform(lambda x: str(tuple(x)))
-        aggregates.append(agg)
-        modified_crosswalk.append(outputs["key_map"])
-        offset += agg.index.max() + 1  # prevent ID overlap when using chunking
 
-    aggregates = pd.concat(aggregates, axis=0)
-    aggregates.to_csv(out_path)
-    modified_crosswalk = pd.concat(modified_crosswalk, axis=0)
-    modified_crosswalk.to_csv(out_path.parent / f"{out_path.stem}_crosswalk_with_IDs.csv")
-    return
+def _write_chunks(
+    results: Iterator[Tuple[pd.DataFrame, pd.DataFrame]],
+    n_chunks: int,
+    out_path: Path,
+    crosswalk_out_path: Path,
+) -> None:
+    """append each chunk's outputs to the csvs, with component IDs unique across chunks"""
+    offset = 0
+    for i, (agg, key_map) in enumerate(tqdm(results, total=n_chunks)):
+        # component IDs start at 0 in every chunk, so shift them past the previous chunks
+        agg.index += offset
+        key_map["component_id"] += offset
+        first_chunk = i == 0
+        agg.to_csv(out_path, mode="w" if first_chunk else "a", header=first_chunk)
+        key_map.to_csv(crosswalk_out_path, mode="w" if first_chunk else "a", header=first_chunk)
+        if len(agg):  # a chunk without components has no max, so keep the offset
+            offset = agg.index.max() + 1  # prevent ID overlap when using chunking
 
 
 def main():
@@ -117,6 +156,12 @@ def main():
         nargs="*",
         help="""optional list of state abbreviations to include in the analysis. Default is all states""",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="""number of chunks to process in parallel. Each worker holds one chunk in memory. Default is 1.""",
+    )
     args = parser.parse_args(sys.argv[1:])
     sys.exit(
         process(
@@ -125,5 +170,6 @@ def main():
             start_year=args.start_year,
             end_year=args.end_year,
             state_subset=args.state_subset,
+            workers=args.workers,
         )
     )
@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
-# from pathlib import Path
-from typing import Sequence, Optional
-import itertools
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, Sequence, Optional, Union
 from os import getenv
+from urllib.request import urlretrieve
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,7 +15,13 @@ load_dotenv()
 # from makefile:install
 EPA_CEMS_DATA_PATH = getenv("EPA_CEMS_DATA_PATH")
 
-EPA_CROSSWALK_RELEASE = "https://github.com/USEPA/camd-eia-crosswalk/releases/download/v0.2.1/"
+EPA_CROSSWALK_VERSION = "v0.2.1"
+EPA_CROSSWALK_RELEASE = (
+    f"https://github.com/USEPA/camd-eia-crosswalk/releases/download/{EPA_CROSSWALK_VERSION}/"
+)
+
+# downloaded files like the EPA crosswalk are kept here between runs
+CACHE_DIR = Path(getenv("RAMPRATE_CACHE_DIR", Path.home() / ".cache" / "ramprate"))
 
 ALL_STATES = (  # includes territories and DC
     "AK",
@@ -76,57 +85,58 @@ ALL_STATES = (  # includes territories and DC
 
 ALL_CEMS_YEARS = range(1995, 2020)
 
+# measured quantities that fit comfortably in single precision.
+# Halves the memory traffic of the scans over these columns in build_features
+FLOAT32_COLUMNS = ("gross_load_mw", "steam_load_1000_lbs", "operating_time_hours")
 
-def year_state_filter(years=(), states=()):
-    """
-    Create filters to read given years and states from partitioned parquet dataset.
+# repeated every hour for each unit, so read dictionary encoded and store each distinct value
+# once as a category. The state partition column is dictionary encoded by the partitioning
+DICTIONARY_COLUMNS = ("unitid",)
+
+# low cardinality crosswalk columns that are only grouped and mapped, never used as join keys
+CROSSWALK_CATEGORICAL_COLUMNS = ("CAMD_FUEL_TYPE", "EIA_FUEL_TYPE", "EIA_UNIT_TYPE")
 
-    This function was the only dependency on the pudl repo, so I copied it from
-    pudl.outputs.epacems.py:year_state_filter
+# same conversions as pd.read_parquet(use_nullable_dtypes=True)
+NULLABLE_DTYPES = {
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+    pa.uint8(): pd.UInt8Dtype(),
+    pa.uint16(): pd.UInt16Dtype(),
+    pa.uint32(): pd.UInt32Dtype(),
+    pa.uint64(): pd.UInt64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+    pa.string(): pd.StringDtype(),
+}
 
-    A subset of an Apache Parquet dataset can be read in more efficiently if files
-    which don't need to be queried are avoideed. Some datasets are partitioned based
-    on the values of columns to make this easier. The EPA CEMS dataset which we
-    publish is partitioned by state and report year.
 
-    This function takes a set of years, and a set of states, and returns a list of lists
-    of tuples, appropriate for use with the read_parquet() methods of pandas and dask
-    dataframes.
+def _partition_filter(
+    years: Optional[Sequence[int]], states: Optional[Sequence[str]]
+) -> Optional[ds.Expression]:
+    """Create a pyarrow expression that selects given years and states from the hive partitioned dataset.
+
+    The expression only references the partition columns, so pyarrow resolves it
+    against the year=/state= directory names and skips non-matching files entirely,
+    without evaluating a row-wise predicate on the data that is read.
+    An empty or None sequence does not filter on that partition.
 
     Args:
-        years (iterable): 4-digit integers indicating the years of data you would like
-            to read. By default it includes all years.
-        states (iterable): 2-letter state abbreviations indicating what states you would
-            like to include. By default it includes all states.
+        years (Optional[Sequence[int]]): 4-digit integers indicating the years of data to read.
+        states (Optional[Sequence[str]]): 2-letter state abbreviations indicating the states to read.
 
     Returns:
-        list: A list of lists of tuples, suitable for use as a filter in the
-        read_parquet method of pandas and dask dataframes.
-
+        Optional[ds.Expression]: filter suitable for pyarrow.dataset.Dataset.to_table, or None if neither partition is filtered
     """
-    year_filters = [("year", "=", year) for year in years]
-    state_filters = [("state", "=", state.upper()) for state in states]
-
-    if states and not years:
-        filters = [
-            [
-                tuple(x),
-            ]
-            for x in state_filters
-        ]
-    elif years and not states:
-        filters = [
-            [
-                tuple(x),
-            ]
-            for x in year_filters
-        ]
-    elif years and states:
-        filters = [list(x) for x in itertools.product(year_filters, state_filters)]
-    else:
-        filters = None
-
-    return filters
+    partition_filter = None
+    if years:
+        partition_filter = ds.field("year").isin(list(years))
+    if states:
+        state_filter = ds.field("state").isin([state.upper() for state in states])
+        partition_filter = (
+            state_filter if partition_filter is None else partition_filter & state_filter
+        )
+    return partition_filter
 
 
 def load_epacems(
@@ -158,45 +168,122 @@ def load_epacems(
     """load EPA CEMS data from PUDL with optional subsetting
 
     Args:
-        states (Optional[Sequence[str]], optional): subset by state abbreviation. Pass None to get all states. Defaults to ("CO",).
-        years (Optional[Sequence[int]], optional): subset by year. Pass None to get all years. Defaults to (2019,).
+        states (Optional[Sequence[str]], optional): subset by state abbreviation. Pass None to get ALL_STATES, or an empty sequence to not filter by state. Defaults to ("CO",).
+        years (Optional[Sequence[int]], optional): subset by year. Pass None to get ALL_CEMS_YEARS, or an empty sequence to not filter by year. Defaults to (2019,).
         columns (Optional[Sequence[str]], optional): subset by column. Pass None to get all columns. Defaults to ( "plant_id_eia", "unitid", "operating_datetime_utc", "operating_time_hours", "gross_load_mw", "state", ).
         engine (Optional[str], optional): choose 'pandas' or 'dask'. Defaults to 'pandas'
 
+    Raises:
+        ValueError: if the dataset is not hive partitioned by year and state
+
     Returns:
         pd.DataFrame: epacems data
     """
+    # states and years are only iterated once, by _partition_filter
     if states is None:
-        states = list(ALL_STATES)
+        states = ALL_STATES
         # states = pudl.constants.us_states.keys()  # all states
-    else:
-        states = list(states)
     if years is None:
-        years = list(ALL_CEMS_YEARS)
+        years = ALL_CEMS_YEARS
         # years = pudl.constants.data_years["epacems"]  # all years
-    else:
-        years = list(years)
     if columns is not None:
-        # columns=None is handled by pd.read_parquet, gives all columns
+        # columns=None is handled by Dataset.to_table, gives all columns
         columns = list(columns)
     if engine != "pandas":
         raise NotImplementedError("dask engine not yet implemented. Only pandas")
 
     # pudl_settings = pudl.workspace.setup.get_defaults()
     # cems_path = Path(pudl_settings["parquet_dir"]) / "epacems"
-    cems = pd.read_parquet(
+    # files are already scanned in parallel, but a chunk of one state and year is a single
+    # file. Parallel column conversion lets that case use more than one core as well
+    parquet_format = ds.ParquetFileFormat(
+        read_options=ds.ParquetReadOptions(
+            dictionary_columns=list(DICTIONARY_COLUMNS), enable_parallel_column_conversion=True
+        )
+    )
+    dataset = ds.dataset(
         # cems_path,
         EPA_CEMS_DATA_PATH,
-        use_nullable_dtypes=True,
+        format=parquet_format,
+        partitioning=ds.HivePartitioning.discover(infer_dictionary=True),
+    )
+    # states and years are selected purely by partition pruning, so the year=/state= layout is required
+    missing_partitions = {"year", "state"}.difference(dataset.schema.names)
+    if missing_partitions:
+        raise ValueError(
+            f"EPA CEMS dataset at {EPA_CEMS_DATA_PATH} is not hive partitioned by {sorted(missing_partitions)}"
+        )
+    table = dataset.to_table(
         columns=columns,
-        # filters=pudl.output.epacems.year_state_filter(
-        filters=year_state_filter(
-            states=states,
-            years=years,
-        ),
+        filter=_partition_filter(years=years, states=states),
+        use_threads=True,
     )
+    # downcast in Arrow one column at a time, so only one extra column is ever in memory
+    casts = {col: pa.float32() for col in FLOAT32_COLUMNS}
+    casts["year"] = pa.int32()  # undo the partition dictionary encoding; only state is a category
+    for col, type_ in casts.items():
+        i = table.schema.get_field_index(col)
+        if i >= 0:
+            table = table.set_column(i, col, table.column(i).cast(type_))
+    # self_destruct frees each Arrow column as soon as it is converted, so the table and
+    # the DataFrame are never both fully in memory. split_blocks avoids consolidating columns
+    cems = table.to_pandas(types_mapper=NULLABLE_DTYPES.get, split_blocks=True, self_destruct=True)
+    del table  # must not be used after self_destruct
     return cems
 
 
-def load_epa_crosswalk():
-    return pd.read_csv(EPA_CROSSWALK_RELEASE + "epa_eia_crosswalk.csv")
+def iter_epacems(
+    states: Sequence[str], states_per_chunk: int = 1, **kwargs
+) -> Iterator[pd.DataFrame]:
+    """load EPA CEMS data a few states at a time, to bound peak memory
+
+    Each chunk only reads the year=/state= partitions of its states. Every unit belongs
+    to a single state, so each chunk holds the complete timeseries of its units.
+
+    Args:
+        states (Sequence[str]): state abbreviations to load
+        states_per_chunk (int, optional): number of states per chunk. Defaults to 1.
+        **kwargs: passed to load_epacems, e.g. years and columns
+
+    Yields:
+        Iterator[pd.DataFrame]: epacems data for each chunk of states
+    """
+    states = list(states)
+    for i in range(0, len(states), states_per_chunk):
+        yield load_epacems(states=states[i : i + states_per_chunk], **kwargs)
+
+
+def load_epa_crosswalk(cache_dir: Union[str, Path] = CACHE_DIR) -> pd.DataFrame:
+    """load the EPA/EIA crosswalk, downloading it only if there is no local copy of this release
+
+    The parsed local copy is also kept in memory, so repeated calls in one process skip the CSV parse.
+
+    Args:
+        cache_dir (Union[str, Path], optional): directory of the local copy. Defaults to CACHE_DIR.
+
+    Returns:
+        pd.DataFrame: EPA/EIA crosswalk
+    """
+    # release assets never change, so a copy named after the pinned release never goes stale
+    path = Path(cache_dir) / f"epa_eia_crosswalk_{EPA_CROSSWALK_VERSION}.csv"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # download to a temporary name so an interrupted download never looks like a valid cache
+        partial = path.with_suffix(".partial")
+        urlretrieve(EPA_CROSSWALK_RELEASE + "epa_eia_crosswalk.csv", partial)
+        partial.replace(path)
+    # copy so callers can't modify the cached frame
+    return _read_epa_crosswalk(path).copy()
+
+
+@lru_cache(maxsize=1)
+def _read_epa_crosswalk(path: Path) -> pd.DataFrame:
+    """parse the local copy of the crosswalk once per process
+
+    Args:
+        path (Path): local copy of the crosswalk. Named after its release, so its contents never change
+
+    Returns:
+        pd.DataFrame: EPA/EIA crosswalk
+    """
+    return pd.read_csv(path, dtype={col: "category" for col in CROSSWALK_CATEGORICAL_COLUMNS})
@@ -3,9 +3,7 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-
-
-idx = pd.IndexSlice
+from matplotlib.lines import Line2D
 
 
 def plot_component_max_ramp(
@@ -17,12 +15,12 @@ def plot_component_max_ramp(
     window_hours: int = 30 * 24,
     cdf=False,
     subplot_kwargs: Optional[Dict[str, Any]] = None,
+    component_series_map: Optional[Dict[int, pd.Series]] = None,
+    unit_series_map: Optional[Dict[int, pd.Series]] = None,
+    close: bool = False,
 ) -> None:
-    try:
-        has_steam = component_aggs.at[component_id, "max_of_sum_steam_load_1000_lbs"] > 0
-    except KeyError:
-        has_steam = False
-    if has_steam:
+    aggs = component_aggs.loc[component_id]  # one row lookup for all the stats below
+    if aggs.get("max_of_sum_steam_load_1000_lbs", 0) > 0:
         raise NotImplementedError("component has steam unit")
     window_offset = pd.Timedelta(window_hours / 2, "h")
     unit_ids = key_map.query(f"component_id == {component_id}")["unit_id_epa"].unique()
@@ -32,6 +30,7 @@ def plot_component_max_ramp(
     subplot_defaults = dict(
         gridspec_kw={"width_ratios": [3, 1], "height_ratios": [1] + [0.6] * (n_rows - 1)},
         figsize=(15, 3 * n_rows + 1),
+        constrained_layout=True,
     )
     if subplot_kwargs is not None:
         subplot_defaults.update(subplot_kwargs)
@@ -45,13 +44,16 @@ def plot_component_max_ramp(
         series_ax = axes[0, 0]
         dist_ax = axes[0, 1]
     col = "gross_load_mw"
-    whole_series = component_timeseries.loc[idx[component_id, :], col]
-    ramp_ts = component_aggs.at[component_id, "idxmax_abs_ramp"]
-    slice_ = idx[component_id, ramp_ts - window_offset : ramp_ts + window_offset]
-    subset = whole_series.loc[slice_]
+    if component_series_map is None:
+        component_series_map = {component_id: component_timeseries.loc[component_id, col]}
+    whole_series = component_series_map[component_id]
+    whole_ramps = _nonzero_ramps(whole_series)
+    ramp_ts = aggs["idxmax_abs_ramp"]
+    slice_ = _window(whole_series, ramp_ts, window_offset)
     _plot_unit_series_and_ramp_dist(
-        subset,
-        whole_series,
+        whole_series.iloc[slice_],
+        whole_ramps[slice_],
+        whole_ramps,
         series_ax,
         dist_ax,
         cdf=cdf,
@@ -60,20 +62,16 @@ def plot_component_max_ramp(
     )
     stats = {
         "component": component_id,
-        "capacity": component_aggs.at[component_id, "sum_of_max_gross_load_mw"],
-        "ramp": component_aggs.at[component_id, "max_abs_ramp"],
-        "ramp_factor": component_aggs.at[component_id, "ramp_factor_sum_max"],
-        "tech_type": component_aggs.at[component_id, "simple_EIA_UNIT_TYPE"],
-        "fuel": component_aggs.at[component_id, "simple_EIA_FUEL_TYPE_via_capacity"],
+        "capacity": aggs["sum_of_max_gross_load_mw"],
+        "ramp": aggs["max_abs_ramp"],
+        "ramp_factor": aggs["ramp_factor_sum_max"],
+        "tech_type": aggs["simple_EIA_UNIT_TYPE"],
+        "fuel": aggs["simple_EIA_FUEL_TYPE_via_capacity"],
     }
-    start_gen = component_timeseries.at[idx[component_id, ramp_ts - pd.Timedelta(1, "h")], col]
-    end_gen = component_timeseries.at[idx[component_id, ramp_ts], col]
-    series_ax.vlines(
-        ramp_ts,
-        ymin=start_gen,
-        ymax=end_gen,
-        colors="r",
-        lw=5,
+    start_gen = whole_series.at[ramp_ts - pd.Timedelta(1, "h")]
+    end_gen = whole_series.at[ramp_ts]
+    series_ax.add_line(
+        Line2D([ramp_ts, ramp_ts], [start_gen, end_gen], color="r", lw=5, solid_capstyle="butt")
     )
     """ series_ax.annotate(
         f"{int(stats['ramp'])} MW/hr\n{stats['ramp_factor']:.2f} %max/hr",
@@ -88,13 +86,16 @@ def plot_component_max_ramp(
 
     # plot the units
     if n_units > 1:
+        if unit_series_map is None:
+            unit_series_map = {unit: cems.loc[unit, col] for unit in unit_ids}
         for i, unit in enumerate(unit_ids, start=1):
-            whole_series = cems.loc[idx[unit, :], col]
-            slice_ = idx[unit, ramp_ts - window_offset : ramp_ts + window_offset]
-            subset = whole_series.loc[slice_]
+            whole_series = unit_series_map[unit]
+            whole_ramps = _nonzero_ramps(whole_series)
+            slice_ = _window(whole_series, ramp_ts, window_offset)
             _plot_unit_series_and_ramp_dist(
-                subset,
-                whole_series,
+                whole_series.iloc[slice_],
+                whole_ramps[slice_],
+                whole_ramps,
                 axes[i, 0],
                 axes[i, 1],
                 cdf=cdf,
@@ -102,13 +103,50 @@ def plot_component_max_ramp(
             )
             axes[i, 0].set_title(f"EPA Unit {unit}")
 
-    plt.tight_layout()
     plt.show()
+    if close:
+        # figures left open keep all their artists alive when plotting in a loop.
+        # Leave close=False to save the figure afterwards, e.g. under a non-interactive backend
+        plt.close(fig)
+
+
+def series_by_id(timeseries: pd.DataFrame, col: str = "gross_load_mw") -> Dict[int, pd.Series]:
+    """split one column of an (id, timestamp) indexed timeseries into a series per id
+
+    Build this once and pass it to plot_component_max_ramp as component_series_map
+    (from component_timeseries) or unit_series_map (from cems) when plotting many components.
+
+    Args:
+        timeseries (pd.DataFrame): component_timeseries or cems, sorted by (id, timestamp)
+        col (str, optional): column to split. Defaults to "gross_load_mw".
+
+    Returns:
+        Dict[int, pd.Series]: timestamp indexed series of col for each id
+    """
+    return {key: group.droplevel(0) for key, group in timeseries[col].groupby(level=0, sort=False)}
+
+
+def _window(series: pd.Series, center: pd.Timestamp, offset: pd.Timedelta) -> slice:
+    """positional slice of a timestamp indexed series covering center +/- offset, inclusive"""
+    start = series.index.searchsorted(center - offset, side="left")
+    stop = series.index.searchsorted(center + offset, side="right")
+    return slice(start, stop)
+
+
+def _nonzero_ramps(series: pd.Series) -> np.ndarray:
+    """hour to hour change in a series, with zeros (no change) replaced by NaN"""
+    values = series.to_numpy()
+    ramps = np.empty(len(values), dtype=np.result_type(values, np.float32))
+    ramps[:1] = np.nan
+    np.subtract(values[1:], values[:-1], out=ramps[1:])
+    ramps[ramps == 0] = np.nan
+    return ramps
 
 
 def _plot_unit_series_and_ramp_dist(
     series: pd.Series,
-    whole_series: pd.Series,
+    ramps: np.ndarray,
+    whole_ramps: np.ndarray,
     series_ax: plt.Axes,
     dist_ax: plt.Axes,
     cdf=False,
@@ -120,9 +158,13 @@ def _plot_unit_series_and_ramp_dist(
         line_kwargs = dict()
     if dist_kwargs is None:
         dist_kwargs = dict()
-    x = series.index.get_level_values(1)
+    x = series.index
     _plot_base_series(x, series, series_ax, **line_kwargs, **kwargs)
+    # bin both distributions on the same edges so the window overlays the whole unit exactly
+    valid = whole_ramps[~np.isnan(whole_ramps)]
+    bins = np.histogram_bin_edges(valid, bins=int(np.sqrt(valid.size))) if valid.size else 1
     window_pdf_defaults = dict(
+        bins=bins,
         histtype="step",
         label="window",
         color=None,
@@ -131,14 +173,15 @@ def _plot_unit_series_and_ramp_dist(
     )
     window_pdf_defaults.update(dist_kwargs)
     _plot_base_pdf(
-        series.diff().replace(0, np.nan),
+        ramps,
         dist_ax,
         **window_pdf_defaults,
         **kwargs,
     )
     _plot_base_pdf(
-        whole_series.diff().replace(0, np.nan),
+        whole_ramps,
         dist_ax,
+        bins=bins,
         label="whole unit",
         color="gray",
         cdf=cdf,
@@ -149,13 +192,66 @@ def _plot_unit_series_and_ramp_dist(
     dist_ax.legend(loc="upper left")
 
 
-def _plot_base_series(x, y, ax: plt.Axes, yaxis_label="Generation [MW]", **kwargs) -> None:
+def _lttb(x: np.ndarray, y: np.ndarray, n_out: int = 2000) -> np.ndarray:
+    """choose n_out points that preserve the visual shape of a series, by Largest-Triangle-Three-Buckets
+
+    The first and last points are kept and the rest are split into n_out - 2 equal buckets.
+    From each bucket, keep the point that makes the largest triangle with the point kept
+    from the previous bucket and the mean of the next bucket.
+
+    Args:
+        x (np.ndarray): numeric x values, sorted
+        y (np.ndarray): y values
+        n_out (int, optional): number of points to keep. Defaults to 2000.
+
+    Returns:
+        np.ndarray: sorted integer positions of the points to keep
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # bucket i is [edges[i], edges[i + 1]). Spacing >= 1, so no bucket is empty
+    edges = 1 + np.arange(n_out - 1) * (n - 2) // (n_out - 2)
+    counts = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / counts, y[-1])
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # twice the triangle area, up to sign
+        area = np.abs(
+            (x[a] - mean_x[i + 1]) * (y[start:stop] - y[a])
+            - (x[a] - x[start:stop]) * (mean_y[i + 1] - y[a])
+        )
+        a = start + np.argmax(np.nan_to_num(area, nan=-1.0))
+        keep[i + 1] = a
+    return keep
+
+
+def _plot_base_series(
+    x, y, ax: plt.Axes, yaxis_label="Generation [MW]", max_points=2000, **kwargs
+) -> None:
+    if len(x) > 4 * max_points:
+        # there are more points than pixels, so plot a downsample with the same shape
+        x = pd.Index(x)
+        x_values = x.values  # tz-aware timestamps give naive UTC datetime64
+        if x_values.dtype.kind in "mM":
+            x_values = x_values.view("i8")
+        keep = _lttb(x_values, y, n_out=max_points)  # anything else is cast to float
+        x = x[keep]
+        y = np.asarray(y)[keep]
     if len(x) <= 60 * 24:
-        line_defaults = dict(c=None, marker=".", markersize=4, lw=1)
+        # rasterize long series so saved figures hold a bitmap instead of a vector per point
+        line_defaults = dict(c=None, marker=".", markersize=4, lw=1, rasterized=len(x) > 1000)
         line_defaults.update(kwargs)
         ax.plot(x, y, **line_defaults)
     else:
-        scatter_defaults = dict(c=None, marker=".", s=4)
+        scatter_defaults = dict(c=None, marker=".", s=4, rasterized=True)
         scatter_defaults.update(kwargs)
         ax.scatter(x, y, **scatter_defaults)
     ax.xaxis.set_major_formatter(mdates.DateFormatter("%b-%d"))
@@ -163,19 +259,42 @@ def _plot_base_series(x, y, ax: plt.Axes, yaxis_label="Generation [MW]", **kwarg
     ax.set_ylabel(yaxis_label)
 
 
+# ax.hist keywords that have no ax.stairs equivalent
+_UNSUPPORTED_HIST_KWARGS = ("align", "bottom", "rwidth", "stacked")
+
+
 def _plot_base_pdf(series, ax: plt.Axes, cdf=False, **kwargs) -> None:
+    unsupported = sorted(kwargs.keys() & set(_UNSUPPORTED_HIST_KWARGS))
+    if unsupported:
+        raise ValueError(f"histogram keywords {unsupported} are not supported")
+    values = np.asarray(series, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if values.size == 0:  # data is all zeros
+        return
     defaults = dict(
-        bins=int(np.sqrt(len(series))),
-        cumulative=cdf,
+        bins=int(np.sqrt(values.size)),
         histtype="stepfilled",
         alpha=0.5,
         density=True,
     )
     defaults.update(kwargs)
-    try:
-        ax.hist(series, **defaults)
-    except ValueError as e:
-        if "[nan, nan]" in e.args[0]:  # data is all zeros
-            pass
-        else:
-            raise e
+    # bin with numpy and draw a single step patch, rather than ax.hist's patch per bin
+    density = defaults.pop("density")
+    counts, edges = np.histogram(
+        values,
+        bins=defaults.pop("bins"),
+        range=defaults.pop("range", None),
+        weights=defaults.pop("weights", None),
+        density=density,
+    )
+    if defaults.pop("cumulative", cdf):
+        counts = np.cumsum(counts * np.diff(edges) if density else counts)
+    # translate the remaining ax.hist keywords
+    fill = defaults.pop("histtype") != "step"
+    log = defaults.pop("log", False)
+    if defaults.get("color") is None:
+        # like ax.hist, take the next color in the axes property cycle
+        defaults["color"] = ax._get_lines.get_next_color()
+    ax.stairs(counts, edges, fill=fill, **defaults)
+    if log:
+        ax.set_yscale("log")
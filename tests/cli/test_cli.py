@@ -0,0 +1,120 @@
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import ramprate.cli
+import ramprate.load_dataset
+from ramprate.cli import process, _write_chunks
+
+
+def _fake_chunk(n_components):
+    agg = pd.DataFrame(
+        {"max_abs_ramp": np.arange(n_components, dtype=np.float64)},
+        index=pd.Index(np.arange(n_components), name="component_id"),
+    )
+    key_map = pd.DataFrame(
+        {
+            "component_id": np.repeat(np.arange(n_components), 2),
+            "unit_id_epa": np.arange(2 * n_components),
+        }
+    )
+    return agg, key_map
+
+
+def test__write_chunks(tmp_path):
+    out_path = tmp_path / "out.csv"
+    crosswalk_out_path = tmp_path / "out_crosswalk_with_IDs.csv"
+    # an existing file is overwritten, not appended to
+    out_path.write_text("stale\n")
+
+    # the empty chunk is a state subset without any matched units
+    chunks = [_fake_chunk(2), _fake_chunk(0), _fake_chunk(3)]
+    _write_chunks(iter(chunks), len(chunks), out_path, crosswalk_out_path)
+
+    # one header line each
+    assert out_path.read_text().count("component_id") == 1
+    assert crosswalk_out_path.read_text().count("component_id") == 1
+    agg = pd.read_csv(out_path, index_col="component_id")
+    assert agg.index.tolist() == [0, 1, 2, 3, 4]
+    assert agg["max_abs_ramp"].tolist() == [0, 1, 0, 1, 2]
+    key_map = pd.read_csv(crosswalk_out_path, index_col=0)
+    assert key_map["component_id"].tolist() == [0, 0, 1, 1, 2, 2, 3, 3, 4, 4]
+
+
+@pytest.fixture
+def cems_path(tmp_path, monkeypatch):
+    dt_idx = pd.date_range(start="2019-01-01 00:00", periods=12, freq="h", tz="UTC")
+    loads = {
+        # state, plant, unitid, unit_id_epa
+        ("CO", 1, "1", 10): [0, 10, 30, 30, 30, 20, 20, 20, 20, 0, 0, 0],
+        ("CO", 2, "1", 20): [5, 5, 5, 50, 55, 60, 60, 60, 60, 60, 0, 0],
+        ("TX", 3, "1", 30): [100] * 6 + [160] * 5 + [170],
+        ("UT", 4, "1", 40): [0, 0, 0, 40, 40, 45, 0, 0, 0, 0, 0, 0],
+        # not in the crosswalk, so WY has no components
+        ("WY", 5, "1", 50): [10] * 12,
+    }
+    cems = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "plant_id_eia": plant,
+                    "unitid": unitid,
+                    "operating_datetime_utc": dt_idx,
+                    "gross_load_mw": np.array(load, dtype=np.float64),
+                    "unit_id_epa": unit,
+                    "year": 2019,
+                    "state": state,
+                }
+            )
+            for (state, plant, unitid, unit), load in loads.items()
+        ],
+        ignore_index=True,
+    )
+    table = pa.Table.from_pandas(cems, preserve_index=False)
+    pq.write_to_dataset(table, str(tmp_path / "cems"), partition_cols=["year", "state"])
+    monkeypatch.setattr(ramprate.load_dataset, "EPA_CEMS_DATA_PATH", str(tmp_path / "cems"))
+
+    xwalk = pd.DataFrame(
+        {
+            "CAMD_PLANT_ID": [1, 2, 3, 4],
+            "CAMD_UNIT_ID": ["1", "1", "1", "1"],
+            "EIA_GENERATOR_ID": ["G1", "G1", "G1", "G1"],
+            "EIA_UNIT_TYPE": ["GT", "CT", "ST", "IC"],
+            "CAMD_NAMEPLATE_CAPACITY": [40, 70, 200, 50],
+            "EIA_NAMEPLATE_CAPACITY": [35, 65, 180, 50],
+            "CAMD_FUEL_TYPE": ["Pipeline Natural Gas"] * 2 + ["Coal", "Diesel Oil"],
+            "EIA_FUEL_TYPE": ["NG", "NG", "BIT", "DFO"],
+            "MATCH_TYPE_GEN": "Exact",
+        }
+    )
+    monkeypatch.setattr(ramprate.cli, "load_epa_crosswalk", lambda: xwalk)
+    return tmp_path
+
+
+def test_process_workers(cems_path):
+    outputs = {}
+    for workers in [1, 2]:
+        out_path = cems_path / f"out_{workers}.csv"
+        process(
+            str(out_path),
+            chunk_size=1,
+            start_year=2019,
+            end_year=2019,
+            state_subset=["CO", "WY", "TX", "UT"],
+            workers=workers,
+        )
+        outputs[workers] = (
+            out_path.read_text(),
+            (cems_path / f"out_{workers}_crosswalk_with_IDs.csv").read_text(),
+        )
+    # worker processes give the same files as processing in-process
+    assert outputs[1] == outputs[2]
+
+    # component IDs continue across the chunks
+    agg = pd.read_csv(cems_path / "out_1.csv", index_col="component_id")
+    assert agg.index.tolist() == [0, 1, 2, 3]
+    key_map = pd.read_csv(cems_path / "out_1_crosswalk_with_IDs.csv", index_col=0)
+    assert key_map["component_id"].tolist() == [0, 1, 2, 3]
+    assert key_map["unit_id_epa"].tolist() == [10, 20, 30, 40]
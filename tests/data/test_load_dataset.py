@@ -0,0 +1,121 @@
+import pytest
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import ramprate.load_dataset
+from ramprate.load_dataset import load_epacems, iter_epacems, load_epa_crosswalk
+
+
+@pytest.fixture
+def cems_path(tmp_path, monkeypatch):
+    frames = []
+    for unit_id, (year, state) in enumerate([(2019, "CO"), (2019, "TX"), (2018, "CO")]):
+        dt_idx = pd.date_range(start=f"{year}-01-01 00:00", periods=4, freq="h", tz="UTC")
+        frames.append(
+            pd.DataFrame(
+                {
+                    "plant_id_eia": 1,
+                    "unitid": "1",
+                    "operating_datetime_utc": dt_idx,
+                    "gross_load_mw": np.array([0, 1, 2, 0], dtype=np.float64),
+                    "unit_id_epa": unit_id,
+                    "year": year,
+                    "state": state,
+                }
+            )
+        )
+    table = pa.Table.from_pandas(pd.concat(frames, ignore_index=True), preserve_index=False)
+    pq.write_to_dataset(table, str(tmp_path), partition_cols=["year", "state"])
+    monkeypatch.setattr(ramprate.load_dataset, "EPA_CEMS_DATA_PATH", str(tmp_path))
+    return tmp_path
+
+
+def test_load_epacems_partition_filter(cems_path):
+    actual = load_epacems(states=["co"], years=[2019])
+    assert list(actual["unit_id_epa"].unique()) == [0]
+    assert actual["operating_datetime_utc"].dt.year.eq(2019).all()
+
+    actual = load_epacems(states=None, years=[2019])
+    assert sorted(list(actual["unit_id_epa"].unique())) == [0, 1]
+
+    # empty sequences do not filter
+    actual = load_epacems(states=[], years=[2019])
+    assert sorted(list(actual["unit_id_epa"].unique())) == [0, 1]
+
+    actual = load_epacems(states=["CO"], years=[])
+    assert sorted(list(actual["unit_id_epa"].unique())) == [0, 2]
+
+    actual = load_epacems(states=None, years=None)
+    assert sorted(list(actual["unit_id_epa"].unique())) == [0, 1, 2]
+
+
+def test_load_epacems_defaults_to_all_years_and_states(cems_path, monkeypatch):
+    monkeypatch.setattr(ramprate.load_dataset, "ALL_CEMS_YEARS", range(2019, 2020))
+    monkeypatch.setattr(ramprate.load_dataset, "ALL_STATES", ("TX",))
+    actual = load_epacems(states=None, years=None)
+    assert list(actual["unit_id_epa"].unique()) == [1]
+
+
+def test_load_epacems_nullable_dtypes(cems_path):
+    actual = load_epacems(states=["CO"], years=[2019])
+    assert actual["unit_id_epa"].dtype == pd.Int64Dtype()
+    assert actual["unitid"].dtype == "category"
+    assert str(actual["operating_datetime_utc"].dt.tz) == "UTC"
+    assert actual["gross_load_mw"].dtype == np.float32
+
+    actual = load_epacems(states=["CO", "TX"], years=[2019], columns=["unitid", "state", "year"])
+    assert actual["state"].dtype == "category"
+    assert actual["year"].dtype == pd.Int32Dtype()
+    assert sorted(actual["state"].unique()) == ["CO", "TX"]
+
+
+def test_iter_epacems_chunks_by_state(cems_path):
+    chunks = list(iter_epacems(["CO", "TX"], years=[2018, 2019]))
+    assert len(chunks) == 2
+    assert sorted(list(chunks[0]["unit_id_epa"].unique())) == [0, 2]
+    assert list(chunks[1]["unit_id_epa"].unique()) == [1]
+
+    chunks = list(iter_epacems(["CO", "TX"], states_per_chunk=2, years=[2018, 2019]))
+    assert len(chunks) == 1
+    assert len(chunks[0]) == 12
+
+
+def test_load_epacems_requires_partitions(tmp_path, monkeypatch):
+    table = pa.Table.from_pandas(pd.DataFrame({"gross_load_mw": [1.0]}), preserve_index=False)
+    pq.write_table(table, str(tmp_path / "cems.parquet"))
+    monkeypatch.setattr(ramprate.load_dataset, "EPA_CEMS_DATA_PATH", str(tmp_path))
+    with pytest.raises(ValueError, match="not hive partitioned"):
+        load_epacems(columns=None)
+
+
+def test_load_epa_crosswalk_uses_cache(tmp_path, monkeypatch):
+    release = tmp_path / "release"
+    release.mkdir()
+    pd.DataFrame({"CAMD_PLANT_ID": [1, 2], "EIA_FUEL_TYPE": ["NG", "NG"]}).to_csv(
+        release / "epa_eia_crosswalk.csv", index=False
+    )
+    monkeypatch.setattr(ramprate.load_dataset, "EPA_CROSSWALK_RELEASE", release.as_uri() + "/")
+    monkeypatch.setattr(ramprate.load_dataset, "EPA_CROSSWALK_VERSION", "v1")
+    cache_dir = tmp_path / "cache"
+
+    expected = load_epa_crosswalk(cache_dir=cache_dir)
+    assert (cache_dir / "epa_eia_crosswalk_v1.csv").exists()
+    assert expected["EIA_FUEL_TYPE"].dtype == "category"
+
+    # the local copy of the release is used even if the release is unavailable
+    (release / "epa_eia_crosswalk.csv").unlink()
+    actual = load_epa_crosswalk(cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(actual, expected)
+
+    # repeated calls don't share the in-memory copy
+    actual.loc[0, "CAMD_PLANT_ID"] = 3
+    pd.testing.assert_frame_equal(load_epa_crosswalk(cache_dir=cache_dir), expected)
+
+    # a new release is downloaded rather than served from the old copy
+    pd.DataFrame({"CAMD_PLANT_ID": [5], "EIA_FUEL_TYPE": ["BIT"]}).to_csv(
+        release / "epa_eia_crosswalk.csv", index=False
+    )
+    monkeypatch.setattr(ramprate.load_dataset, "EPA_CROSSWALK_VERSION", "v2")
+    assert load_epa_crosswalk(cache_dir=cache_dir)["CAMD_PLANT_ID"].tolist() == [5]
@@ -2,7 +2,17 @@ import pytest
 import pandas as pd
 import numpy as np
 
-from ramprate.build_features import _find_uptime
+from ramprate.build_features import (
+    _find_uptime,
+    _filter_retirements,
+    _sum_by_component,
+    _assign_by_capacity,
+    aggregate_subcomponents,
+    make_subcomponent_ids,
+    uptime_events,
+    calc_distance_from_downtime,
+    process_subset,
+)
 
 
 def test__find_uptime_start_and_end_nonzero():
@@ -32,6 +42,25 @@ def test__find_uptime_start_and_end_nonzero():
     assert actual.diff(axis=1)["shutdown"].dt.total_seconds().fillna(1).ge(0).all()
 
 
+def test__find_uptime_keeps_index_tz():
+    data = [2, 2, 0, 0, 0, 2]
+    for tz in [None, "America/Denver"]:
+        dt_idx = pd.date_range(start="2020-01-01 00:00", periods=6, freq="h", tz=tz)
+        shutdown = pd.DatetimeIndex(["2020-01-01 02:00"], tz=tz)
+        startup = pd.DatetimeIndex(["2020-01-01 04:00"], tz=tz)
+        expected = pd.DataFrame({"shutdown": shutdown, "startup": startup})
+        actual = _find_uptime(pd.Series(data, index=dt_idx), downtime=True)
+        pd.testing.assert_frame_equal(actual, expected)
+
+        # timestamp level of a multiindex
+        unit_idx = pd.MultiIndex.from_arrays(
+            [np.full(6, 7), dt_idx], names=["unit_id_epa", "operating_datetime_utc"]
+        )
+        actual = _find_uptime(pd.Series(data, index=unit_idx), multiindex_key=7, downtime=True)
+        expected.index = pd.MultiIndex.from_arrays([[7], [0]], names=["unit_id_epa", "event"])
+        pd.testing.assert_frame_equal(actual, expected)
+
+
 def test__find_uptime_all_zeros():
     dt_idx = pd.date_range(start="2020-01-01 00:00", periods=6, freq="h", tz="UTC")
     data = [0, 0, 0, 0, 0, 0]
@@ -103,3 +132,252 @@ def test__find_uptime_start_zero_end_zero():
     pd.testing.assert_frame_equal(actual, expected)
     # end points ('shutdown') are after start points ('startup')
     assert actual.diff(axis=1)["shutdown"].dt.total_seconds().fillna(1).ge(0).all()
+
+
+def test_uptime_events_matches_find_uptime():
+    dt_idx = pd.date_range(start="2020-01-01 00:00", periods=6, freq="h", tz="UTC")
+    data = {
+        1: [2, 2, 0, 0, 0, 2],
+        2: [0, 0, 0, 0, 0, 0],
+        3: [5, 5, 5, 5, 5, 5],
+        4: [0, 2, 2, 0, 2, 0],
+    }
+    cems = pd.concat(
+        [
+            pd.DataFrame(
+                {"unit_id_epa": unit, "operating_datetime_utc": dt_idx, "gross_load_mw": load}
+            )
+            for unit, load in data.items()
+        ]
+    ).set_index(["unit_id_epa", "operating_datetime_utc"], drop=False)
+
+    expected = pd.concat(
+        [
+            _find_uptime(cems.loc[[unit], "gross_load_mw"], multiindex_key=unit)
+            for unit in data.keys()
+        ]
+    )
+    actual = uptime_events(cems, infer_boundaries=False)
+    pd.testing.assert_frame_equal(actual.drop(columns="duration_hours"), expected)
+
+    actual = uptime_events(cems, infer_boundaries=True)
+    assert actual.loc[(1, 0), "startup"] == dt_idx[0]
+    assert actual.loc[(3, 0), "shutdown"] == dt_idx[-1]
+    assert actual["duration_hours"].tolist() == [2.0, 1.0, 5.0, 3.0, 2.0]
+
+
+def test_calc_distance_from_downtime():
+    dt_idx = pd.date_range(start="2020-01-01 00:00", periods=4, freq="h", tz="UTC")
+    data = {1: [0, 2, 2, 0], 2: [2, 2, 0, 2]}
+    cems = pd.concat(
+        [
+            pd.DataFrame(
+                {"unit_id_epa": unit, "operating_datetime_utc": dt_idx, "gross_load_mw": load}
+            )
+            for unit, load in data.items()
+        ]
+    ).set_index(["unit_id_epa", "operating_datetime_utc"], drop=False)
+
+    calc_distance_from_downtime(cems)  # in place
+    # edges of each unit are assumed to be 24 hours from the unobserved startup/shutdown
+    expected_from_startup = [24, 0, 1, 2, 24, 25, 26, 0]
+    expected_to_shutdown = [3, 2, 1, 0, 2, 1, 0, 24]
+    assert cems["hours_from_startup"].tolist() == expected_from_startup
+    assert cems["hours_to_shutdown"].tolist() == expected_to_shutdown
+    assert cems["hours_distance"].tolist() == [3, 0, 1, 0, 2, 1, 0, 0]
+    assert cems["hours_from_startup"].dtype == np.float32
+
+
+def test_calc_distance_from_downtime_classify_startup():
+    dt_idx = pd.date_range(start="2020-01-01 00:00", periods=6, freq="h", tz="UTC")
+    # the third hour of each unit but the last is as far from startup as from shutdown
+    cems = pd.concat(
+        [
+            pd.DataFrame(
+                {"unit_id_epa": unit, "operating_datetime_utc": dt_idx, "gross_load_mw": load}
+            )
+            for unit, load in enumerate([[0, 2, 2, 2, 2, 0]] * 20 + [[0, 2, 2, 2, 0, 0]])
+        ]
+    ).set_index(["unit_id_epa", "operating_datetime_utc"], drop=False)
+
+    calc_distance_from_downtime(cems, classify_startup=True)  # in place
+    from_startup = cems["hours_from_startup"].to_numpy()
+    to_shutdown = cems["hours_to_shutdown"].to_numpy()
+    np.testing.assert_array_equal(cems["hours_distance"], np.fmin(from_startup, to_shutdown))
+    tied = from_startup == to_shutdown
+    assert tied.sum() == 20
+    actual = cems["nearest_to_startup"].to_numpy()
+    np.testing.assert_array_equal(actual[~tied], (from_startup < to_shutdown)[~tied])
+    # ties are split at random, but the same way every time
+    assert 0 < actual[tied].sum() < 20
+    repeat = cems.drop(columns=["hours_distance", "nearest_to_startup"])
+    calc_distance_from_downtime(repeat, classify_startup=True)
+    np.testing.assert_array_equal(repeat["nearest_to_startup"], actual)
+
+
+def test__filter_retirements():
+    xwalk = pd.DataFrame(
+        {
+            "CAMD_RETIRE_YEAR": [0, 2017, 2019, 0, 0],
+            "CAMD_STATUS_DATE": ["2000-01-01", "2000-01-01", "2000-01-01", "2021-06-01", None],
+            "CAMD_STATUS": ["OPR", "RET", "OPR", "OPR", "OPR"],
+        }
+    )
+    # operating, retired before start, retired during range, built after end, unknown date
+    actual = _filter_retirements(xwalk, year_range=(2018, 2020))
+    pd.testing.assert_frame_equal(actual, xwalk.iloc[[0, 2]])
+
+
+def test_make_subcomponent_ids():
+    # plant 1: two combustors share a steam generator; plant 2: one combustor, one generator
+    xwalk = pd.DataFrame(
+        {
+            "CAMD_PLANT_ID": [1, 1, 1, 1, 2],
+            "CAMD_UNIT_ID": ["CT1", "CT1", "CT2", "CT2", "1"],
+            "EIA_GENERATOR_ID": ["G1", "ST", "G2", "ST", "G1"],
+        }
+    )
+    actual = make_subcomponent_ids(xwalk, cems=None)
+    assert list(actual.columns) == ["component_id"] + list(xwalk.columns)
+    components = actual.groupby("CAMD_PLANT_ID")["component_id"].unique()
+    assert len(components[1]) == 1
+    assert len(components[2]) == 1
+    assert components[1][0] != components[2][0]
+
+
+def test_make_subcomponent_ids_row_order():
+    xwalk = pd.DataFrame(
+        {
+            "CAMD_PLANT_ID": [1, 2, 1, 1, 1, 1],
+            "CAMD_UNIT_ID": ["CT1", "1", "CT2", "CT2", "CT1", "CT1"],
+            "EIA_GENERATOR_ID": ["G1", "G1", "ST", "G2", "ST", "G1"],
+            "row": [0, 1, 2, 3, 4, 5],
+        }
+    )
+    actual = make_subcomponent_ids(xwalk, cems=None)
+    # same order as the networkx edgelist: edges from each node in order of first appearance.
+    # The duplicated CT1-G1 edge stays in its first position, with the values of its last row
+    assert actual["row"].tolist() == [5, 4, 1, 2, 3]
+    assert actual["component_id"].tolist() == [0, 0, 1, 0, 0]
+
+
+def test__assign_by_capacity_skips_missing_keys_and_values():
+    xwalk = pd.DataFrame(
+        {
+            "component_id": [0, 0, 0, 0],
+            "EIA_GENERATOR_ID": ["A", "A", "B", np.nan],
+            # the first non-null capacity of each generator counts, even if it is not on its first row
+            "EIA_NAMEPLATE_CAPACITY": [np.nan, 10.0, 5.0, 100.0],
+            "simple_EIA_FUEL_TYPE": ["gas", "gas", "oil", "coal"],
+        }
+    )
+    # the row without a generator ID is ignored, like groupby does
+    actual = _assign_by_capacity(xwalk, "simple_EIA_FUEL_TYPE")
+    assert actual["simple_EIA_FUEL_TYPE"].to_dict() == {0: "gas"}
+
+
+def test_aggregate_subcomponents_capacity():
+    xwalk = pd.DataFrame(
+        {
+            "component_id": [0, 0, 0, 1],
+            "CAMD_UNIT_ID": ["1", "1", "2", "1"],
+            "EIA_GENERATOR_ID": ["A", "B", np.nan, "A"],
+            "EIA_UNIT_TYPE": ["CT", "CA", "CT", "GT"],
+            "CAMD_NAMEPLATE_CAPACITY": [np.nan, 50.0, 20.0, 0.0],
+            "EIA_NAMEPLATE_CAPACITY": [30.0, 25.0, 99.0, 0.0],
+            "CAMD_FUEL_TYPE": ["Natural Gas", "Natural Gas", "Coal", "Diesel Oil"],
+            "EIA_FUEL_TYPE": ["NG", "NG", "BIT", "DFO"],
+        }
+    )
+    actual = aggregate_subcomponents(xwalk)
+    # unit "1" counts once with its first non-null capacity; generator NaN is ignored;
+    # zero capacity is missing
+    assert actual.loc[0, "capacity_CAMD"] == 70.0
+    assert actual.loc[0, "capacity_EIA"] == 55.0
+    assert actual.loc[[1], ["capacity_CAMD", "capacity_EIA"]].isna().all(axis=None)
+
+
+def test__sum_by_component():
+    dt_idx = pd.date_range(start="2020-01-01 00:00", periods=3, freq="h", tz="UTC")
+    # component 0 has two units, component 1 has one, component 2 has a single row
+    cems = pd.DataFrame(
+        {
+            "component_id": [0, 0, 0, 0, 0, 0, 1, 1, 1, 2],
+            "operating_datetime_utc": dt_idx[[0, 1, 2, 0, 1, 2, 0, 1, 2, 0]],
+            "gross_load_mw": np.array(
+                [1.5, np.nan, 3.0, 0.1, np.nan, 0.2, 7.0, 8.0, 9.0, 4.0], dtype=np.float32
+            ),
+            "exclude_ramp": [False, True, False, False, False, False, True, False, False, False],
+        }
+    ).sample(frac=1, random_state=0)
+
+    expected = cems.groupby(["component_id", "operating_datetime_utc"]).agg(
+        {"gross_load_mw": "sum", "exclude_ramp": "any"}
+    )
+    actual = _sum_by_component(cems)
+    pd.testing.assert_frame_equal(actual, expected)
+    assert actual["gross_load_mw"].dtype == np.float32
+
+
+def test_process_subset():
+    dt_idx = pd.date_range(start="2020-01-01 00:00", periods=12, freq="h", tz="UTC")
+    loads = {
+        # plant 1: two combustion turbines sharing a steam turbine. CT2 starts up at hour 3,
+        # so the combined cycle ramps in the following 7 hours are excluded
+        (1, "CT1", 10): [100] * 6 + [160] * 5 + [170],
+        (1, "CT2", 11): [0] * 3 + [50] * 9,
+        # plant 2: a gas turbine (no exclusions) and a unit that is not in the crosswalk
+        (2, "1", 20): [0, 10, 30, 30, 30, 20, 20, 20, 20, 0, 0, 0],
+        (2, "2", 21): [5] * 12,
+    }
+    cems = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "plant_id_eia": plant,
+                    "unitid": unitid,
+                    "operating_datetime_utc": dt_idx,
+                    "gross_load_mw": np.array(load, dtype=np.float32),
+                    "unit_id_epa": unit,
+                }
+            )
+            for (plant, unitid, unit), load in loads.items()
+        ],
+        ignore_index=True,
+    ).astype({"plant_id_eia": "Int64", "unit_id_epa": "Int64"})
+    # not indexed and not sorted
+    cems = cems.sample(frac=1, random_state=0).reset_index(drop=True)
+    xwalk = pd.DataFrame(
+        {
+            "CAMD_PLANT_ID": [1, 1, 1, 1, 2],
+            "CAMD_UNIT_ID": ["CT1", "CT1", "CT2", "CT2", "1"],
+            "EIA_GENERATOR_ID": ["G1", "ST", "G2", "ST", "G1"],
+            "EIA_UNIT_TYPE": ["CT", "CA", "CT", "CA", "GT"],
+            "CAMD_NAMEPLATE_CAPACITY": [200, 200, 100, 100, 40],
+            "EIA_NAMEPLATE_CAPACITY": [150, 120, 80, 120, 35],
+            "CAMD_FUEL_TYPE": ["Pipeline Natural Gas"] * 4 + ["Diesel Oil"],
+            "EIA_FUEL_TYPE": ["NG"] * 4 + ["DFO"],
+        }
+    )
+
+    actual = process_subset(cems, xwalk)
+
+    key_map = actual["key_map"]
+    assert key_map["component_id"].tolist() == [0, 0, 0, 0, 1]
+    assert key_map["unit_id_epa"].tolist() == [10, 10, 11, 11, 20]
+    assert key_map["EIA_GENERATOR_ID"].tolist() == ["G1", "ST", "ST", "G2", "G1"]
+    assert 21 not in actual["cems"]["unit_id_epa"].tolist()
+
+    aggs = actual["component_aggs"]
+    assert aggs.index.tolist() == [0, 1]
+    assert aggs["sum_of_max_gross_load_mw"].tolist() == [220, 30]
+    assert aggs["max_of_sum_gross_load_mw"].tolist() == [220, 30]
+    # the 50 and 60 MW jumps of component 0 fall in CT2's startup exclusion zone
+    assert aggs["max_abs_ramp"].tolist() == [10, 20]
+    assert aggs["idxmax_abs_ramp"].tolist() == [dt_idx[11], dt_idx[2]]
+    assert aggs["EIA_UNIT_TYPE"].tolist() == [frozenset({"CT", "CA"}), frozenset({"GT"})]
+    assert aggs["simple_EIA_UNIT_TYPE"].tolist() == ["combined_cycle", "gas_turbine"]
+    assert aggs["capacity_CAMD"].tolist() == [300, 40]
+    assert aggs["capacity_EIA"].tolist() == [350, 35]
+    assert aggs["simple_EIA_FUEL_TYPE_via_capacity"].tolist() == ["gas", "oil"]
+    assert aggs["ramp_factor_sum_max"].tolist() == pytest.approx([10 / 220, 20 / 30])
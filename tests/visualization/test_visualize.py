@@ -0,0 +1,128 @@
+import pytest
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
+
+from ramprate.visualize import (
+    series_by_id,
+    _lttb,
+    _nonzero_ramps,
+    _plot_base_pdf,
+    _plot_base_series,
+    _plot_unit_series_and_ramp_dist,
+    _window,
+)
+
+
+def test__lttb():
+    rng = np.random.default_rng(0)
+    n = 10_000
+    x = np.arange(n, dtype=np.float64)
+    y = rng.uniform(0, 1, n)
+    y[4321] = 100.0  # a single spike
+
+    actual = _lttb(x, y, n_out=100)
+    assert len(actual) == 100
+    assert actual[0] == 0
+    assert actual[-1] == n - 1
+    assert (np.diff(actual) > 0).all()
+    assert 4321 in actual
+
+
+def test__lttb_fallbacks():
+    x = np.arange(10, dtype=np.float64)
+    y = x**2
+    # nothing to downsample
+    np.testing.assert_array_equal(_lttb(x, y, n_out=10), np.arange(10))
+    np.testing.assert_array_equal(_lttb(x, y, n_out=20), np.arange(10))
+    # too few points to keep both ends and a bucket
+    np.testing.assert_array_equal(_lttb(x, y, n_out=2), np.arange(10))
+
+
+def test__plot_base_pdf():
+    values = np.array([1.0, 2.0, 2.0, 3.0, np.nan])
+    fig, ax = plt.subplots()
+    # like ax.hist, unset colors come from the axes property cycle
+    _plot_base_pdf(values, ax, bins=[1, 2, 3, 4], histtype="step", color=None)
+    _plot_base_pdf(values, ax, bins=[1, 2, 3, 4], histtype="bar")
+    _plot_base_pdf(values, ax, bins=[1, 2, 3, 4], color="gray", cdf=True, log=True)
+    step, bar, cumulative = ax.patches
+    cycle = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+    assert step.get_edgecolor()[:3] == mcolors.to_rgb(cycle[0])
+    assert bar.get_facecolor()[:3] == mcolors.to_rgb(cycle[1])
+    assert cumulative.get_facecolor()[:3] == mcolors.to_rgb("gray")
+    assert not step.get_fill()
+    assert bar.get_fill()
+    np.testing.assert_allclose(step.get_data().values, [0.25, 0.5, 0.25])
+    np.testing.assert_allclose(cumulative.get_data().values, [0.25, 0.75, 1.0])
+    assert ax.get_yscale() == "log"
+
+    with pytest.raises(ValueError, match="rwidth"):
+        _plot_base_pdf(values, ax, rwidth=0.8)
+    plt.close(fig)
+
+
+def test_series_by_id():
+    dt_idx = pd.date_range(start="2020-01-01 00:00", periods=3, freq="h", tz="UTC")
+    timeseries = pd.DataFrame(
+        {"gross_load_mw": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]},
+        index=pd.MultiIndex.from_product([[7, 3], dt_idx], names=["component_id", "timestamp"]),
+    )
+    actual = series_by_id(timeseries)
+    assert list(actual) == [7, 3]
+    pd.testing.assert_series_equal(
+        actual[3],
+        pd.Series([4.0, 5.0, 6.0], index=dt_idx.rename("timestamp"), name="gross_load_mw"),
+    )
+
+
+def test__nonzero_ramps():
+    series = pd.Series(np.array([1, 3, 3, 0, 2], dtype=np.float32))
+    actual = _nonzero_ramps(series)
+    assert actual.dtype == np.float32
+    np.testing.assert_array_equal(actual, [np.nan, 2, np.nan, -3, 2])
+    # integer input gives float ramps so they can hold NaN
+    assert _nonzero_ramps(pd.Series([1, 2])).dtype == np.float64
+
+
+def test__window():
+    dt_idx = pd.date_range(start="2020-01-01 00:00", periods=10, freq="h", tz="UTC")
+    series = pd.Series(np.arange(10), index=dt_idx)
+    offset = pd.Timedelta(2, "h")
+    # inclusive at both ends
+    assert series.iloc[_window(series, dt_idx[5], offset)].tolist() == [3, 4, 5, 6, 7]
+    # clipped at the edges of the series
+    assert series.iloc[_window(series, dt_idx[0], offset)].tolist() == [0, 1, 2]
+    assert series.iloc[_window(series, dt_idx[9], offset)].tolist() == [7, 8, 9]
+    # entirely outside the series
+    assert series.iloc[_window(series, dt_idx[0] - 3 * offset, offset)].empty
+
+
+def test__plot_unit_series_and_ramp_dist_shares_bins():
+    dt_idx = pd.date_range(start="2020-01-01 00:00", periods=100, freq="h", tz="UTC")
+    series = pd.Series(np.random.default_rng(0).uniform(0, 100, 100), index=dt_idx)
+    whole_ramps = _nonzero_ramps(series)
+    fig, (series_ax, dist_ax) = plt.subplots(ncols=2)
+    _plot_unit_series_and_ramp_dist(
+        series.iloc[40:60], whole_ramps[40:60], whole_ramps, series_ax, dist_ax
+    )
+    window, whole = dist_ax.patches
+    # the window is binned on the edges of the whole unit, not on its own range
+    np.testing.assert_array_equal(window.get_data().edges, whole.get_data().edges)
+    assert len(whole.get_data().values) == int(np.sqrt(99))
+    plt.close(fig)
+
+
+def test__plot_base_series_downsamples():
+    n = 1000
+    y = np.random.default_rng(0).uniform(0, 100, n)
+    y[321] = 500.0
+    dt_idx = pd.date_range(start="2020-01-01 00:00", periods=n, freq="h", tz="UTC")
+    for x in [dt_idx, dt_idx.tz_localize(None).values, pd.RangeIndex(n), np.arange(n) / 2]:
+        fig, ax = plt.subplots()
+        _plot_base_series(x, pd.Series(y), ax, max_points=100)
+        (line,) = ax.lines
+        assert len(line.get_xdata()) == 100
+        assert 500.0 in line.get_ydata()
+        plt.close(fig)